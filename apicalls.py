@@ -10,6 +10,7 @@ import json
 import os
 import pandas as pd
 import requests
+import coordinator
 
 # Specify a URL that resolves to your workspace
 URL = "http://127.0.0.1:8000"
@@ -57,7 +58,8 @@ def api_call():
     ]
 
     api_report = pd.DataFrame(data, columns=['key', 'value'])
-    api_report.to_csv(report_path, index=False, header=False, sep='\t')
+    with coordinator.atomic_write(report_path) as file:
+        api_report.to_csv(file, index=False, header=False, sep='\t')
 
 
 if __name__ == "__main__":
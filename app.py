@@ -5,11 +5,15 @@ author: Ondrej Ploteny <ondrej.ploteny@thermofisher.com>
 Nov 2023
 """
 
-from flask import Flask, session, jsonify, request
-import pandas as pd
+from flask import Flask, session, jsonify, request, g, Response
 import json
 import os
-from diagnostics import model_predictions, dataframe_summary, missing_data, execution_time, outdated_packages_list
+import timeit
+import instrumentation
+import schema
+import coordinator
+from predictioncache import prediction_cache
+from diagnostics import deployed_model, model_predictions, dataframe_summary, missing_data, execution_time, outdated_packages_list
 from scoring import score_model
 
 # Set up variables for use in our script
@@ -23,6 +27,32 @@ dataset_csv_path = os.path.join(config['output_folder_path'])
 
 prediction_model = None
 
+request_latency = instrumentation.histogram('http_request_duration_seconds', 'API request latency',
+                                            labelnames=('endpoint', 'method'))
+request_count = instrumentation.counter('http_requests_total', 'Number of API requests',
+                                        labelnames=('endpoint', 'method', 'status'))
+
+
+@app.before_request
+def start_request_timer():
+    """
+    Remember request start time for latency metrics
+    """
+    g.request_start = timeit.default_timer()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Record request latency and status code
+    :param response: flask response
+    :return: unchanged response
+    """
+    endpoint = request.url_rule.rule if request.url_rule else 'unknown'
+    request_latency.observe(timeit.default_timer() - g.request_start, endpoint=endpoint, method=request.method)
+    request_count.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
 
 @app.route("/prediction", methods=['POST', 'OPTIONS'])
 def predict():
@@ -33,12 +63,18 @@ def predict():
     """
     dataset_path = request.get_json()['filepath']
 
-    predictor_column_name = ['lastmonth_activity',
-                             'lastyear_activity',
-                             'number_of_employees']
-
-    df = pd.read_csv(dataset_path, usecols=predictor_column_name)
-    y_pred = model_predictions(df)
+    # cache key holds model version, so a newly deployed model invalidates cached predictions
+    model, model_version, model_generation = deployed_model()
+    cache_key = prediction_cache.key(dataset_path, model_version)
+    y_pred = prediction_cache.get(cache_key, model_generation)
+    if y_pred is None:
+        try:
+            df = schema.read_dataset(dataset_path, usecols=schema.PREDICTOR_COLUMNS)
+        except ValueError as error:
+            # missing columns, blank or non-integer values do not match the schema dtypes
+            return jsonify({'error': f"{dataset_path} does not match dataset schema: {error}"}), 400
+        y_pred = model_predictions(df, model=model)
+        prediction_cache.put(cache_key, y_pred)
     return jsonify(y_pred)
 
 
@@ -68,16 +104,42 @@ def summary():
 def diagnostics():
     """
     Diagnostics Endpoint
+    timing re-runs training.py and ingestion.py, which rewrite pipeline artifacts,
+    so it holds the pipeline lock and answers 503 while a pipeline run is in progress
     :return:
     """
+    try:
+        with coordinator.pipeline_lock():
+            time_check = execution_time()
+    except coordinator.PipelineLocked:
+        return jsonify({'error': 'pipeline run in progress, try again later'}), 503
+
     diagnostics_dict = {
         'missing': missing_data(),
-        'time_check': execution_time(),
+        'time_check': time_check,
         'outdated': outdated_packages_list()
     }
 
     return jsonify(diagnostics_dict)
 
 
+@app.route("/predictioncache", methods=['GET'])
+def prediction_cache_stats():
+    """
+    Prediction Cache Endpoint
+    :return: number of cached entries, used bytes, memory budget and cached model version
+    """
+    return jsonify(prediction_cache.stats())
+
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """
+    Metrics Endpoint
+    :return: all metrics of this process in Prometheus text format
+    """
+    return Response(instrumentation.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 if __name__ == "__main__":    
     app.run(host='0.0.0.0', port=8000, debug=True, threaded=True)
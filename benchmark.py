@@ -0,0 +1,315 @@
+"""
+This script provides a load-testing and latency benchmark of API endpoints.
+
+It starts the Flask app locally, drives concurrent load against each endpoint,
+reports QPS, p50/p95/p99/max latency and server RSS, stores the results as
+a JSON baseline and compares new runs against it.
+
+usage:
+    python benchmark.py --save-baseline
+    python benchmark.py --check
+
+author: Ondrej Ploteny <ondrej.ploteny@thermofisher.com>
+Nov 2023
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import requests
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+# Load config.json and get path variables
+with open('config.json', 'r') as f:
+    config = json.load(f)
+
+test_data_path = os.path.join(config['test_data_path'], 'testdata.csv')
+benchmark_path = os.path.join(config['benchmark_path'])
+baseline_path = os.path.join(benchmark_path, 'baseline.json')
+latest_path = os.path.join(benchmark_path, 'latest.json')
+
+HOST = '127.0.0.1'
+PORT = 8001
+
+# /diagnostics re-runs training.py and ingestion.py, which rewrite the dataset
+# and the model, so it is benchmarked only when asked for explicitly
+DEFAULT_ENDPOINTS = ['prediction', 'scoring', 'summarystats']
+ALL_ENDPOINTS = DEFAULT_ENDPOINTS + ['diagnostics']
+DEFAULT_PAYLOAD_ROWS = [5, 1000, 100000]
+
+
+def start_server(port: int = PORT):
+    """
+    Start the Flask app in a subprocess and wait until it accepts connections
+    :param port: int port to bind the app to
+    :return: subprocess.Popen of the running server
+    """
+    command = [sys.executable, '-c',
+               f"from app import app; app.run(host='{HOST}', port={port}, threaded=True)"]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = timeit.default_timer() + 30
+    while timeit.default_timer() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"API server exited with code {server.returncode}")
+        try:
+            socket.create_connection((HOST, port), timeout=0.5).close()
+            logging.info(f"STEP: benchmark, API server started, pid {server.pid}")
+            return server
+        except OSError:
+            pass
+    server.terminate()
+    raise RuntimeError("API server did not start within 30 seconds")
+
+
+def read_rss(pid: int):
+    """
+    Read current and peak resident set size of a process (Linux only)
+    :param pid: int process id
+    :return: dict with rss_mb and peak_rss_mb, values are None if not available
+    """
+    rss = {'rss_mb': None, 'peak_rss_mb': None}
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    rss['rss_mb'] = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    rss['peak_rss_mb'] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return rss
+
+
+def make_payload(rows: int, directory: str):
+    """
+    Create a prediction payload file by resampling the test dataset
+    :param rows: int number of rows in the payload
+    :param directory: str directory to write the payload to
+    :return: str absolute path to the payload csv
+    """
+    test_df = pd.read_csv(test_data_path)
+    payload_df = test_df.sample(n=rows, replace=True, random_state=0)
+    payload_path = os.path.abspath(os.path.join(directory, f'payload_{rows}.csv'))
+    payload_df.to_csv(payload_path, index=False)
+    return payload_path
+
+
+def link_payloads(payload_path: str, count: int):
+    """
+    Create distinct paths of the same payload, so every request misses the server-side prediction cache
+    hard links are used to avoid copying large payloads, files are copied if linking is not supported
+    :param payload_path: str path to payload csv
+    :param count: int number of paths
+    :return: list of str absolute paths
+    """
+    root, extension = os.path.splitext(payload_path)
+    link_paths = list()
+    for i in range(count):
+        link_path = f'{root}_{i}{extension}'
+        try:
+            os.link(payload_path, link_path)
+        except OSError:
+            shutil.copyfile(payload_path, link_path)
+        link_paths.append(link_path)
+    return link_paths
+
+
+def _timed_request(session: requests.Session, method: str, url: str, body: dict = None):
+    """
+    Send a single request and measure its latency
+    :return: tuple (latency in seconds, bool success)
+    """
+    start_time = timeit.default_timer()
+    try:
+        response = session.request(method, url, json=body, timeout=300)
+        ok = response.status_code == 200
+    except requests.RequestException:
+        ok = False
+    return timeit.default_timer() - start_time, ok
+
+
+def run_scenario(url: str, method: str, bodies: list, concurrency: int, server_pid: int = None,
+                 warmup_body: dict = None):
+    """
+    Drive concurrent load against a single endpoint
+    :param url: str endpoint url
+    :param method: str HTTP method
+    :param bodies: list of json bodies (or None), one per request
+    :param concurrency: int number of concurrent clients
+    :param server_pid: int pid of the server to sample RSS from
+    :param warmup_body: dict json body of the warm-up request, first of bodies if not given
+    :return: dict with throughput, latency percentiles and RSS
+    """
+    n_requests = len(bodies)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+
+    # warm up the connection pool and the model load
+    _timed_request(session, method, url, warmup_body or bodies[0])
+
+    start_time = timeit.default_timer()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda body: _timed_request(session, method, url, body), bodies))
+    duration = timeit.default_timer() - start_time
+
+    latencies_ms = np.array([latency for latency, _ in results]) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    result = {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'errors': sum(not ok for _, ok in results),
+        'qps': n_requests / duration,
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'max_ms': latencies_ms.max(),
+    }
+    if server_pid is not None:
+        result.update(read_rss(server_pid))
+    return result
+
+
+def run_benchmark(base_url: str, endpoints: list, payload_rows: list, concurrency: int, n_requests: int,
+                  server_pid: int = None):
+    """
+    Run all benchmark scenarios, /prediction is run twice per payload size:
+        prediction_<rows> - distinct file path per request, every request is scored (cache misses)
+        prediction_<rows>_cached - same file for every request, served from prediction cache
+    :return: dict of scenario name -> scenario result
+    """
+    scenarios = dict()
+    with tempfile.TemporaryDirectory() as payload_dir:
+        for endpoint in endpoints:
+            if endpoint == 'prediction':
+                for rows in payload_rows:
+                    payload_path = make_payload(rows, payload_dir)
+                    uncached_bodies = [{'filepath': path} for path in link_payloads(payload_path, n_requests)]
+                    cached_bodies = [{'filepath': payload_path}] * n_requests
+                    for name, bodies in [(f'prediction_{rows}', uncached_bodies),
+                                         (f'prediction_{rows}_cached', cached_bodies)]:
+                        # warm-up with the original payload, so no measured uncached request hits the cache
+                        scenarios[name] = run_scenario(base_url + '/prediction', 'POST', bodies,
+                                                       concurrency, server_pid,
+                                                       warmup_body={'filepath': payload_path})
+                        logging.info(f"STEP: benchmark, {name}: {scenarios[name]}")
+            else:
+                scenarios[endpoint] = run_scenario(base_url + '/' + endpoint, 'GET', [None] * n_requests,
+                                                   concurrency, server_pid)
+                logging.info(f"STEP: benchmark, {endpoint}: {scenarios[endpoint]}")
+    return scenarios
+
+
+def save_results(scenarios: dict, path: str):
+    """
+    Write benchmark results to a json file
+    :param scenarios: dict of scenario results
+    :param path: str output path
+    :return: None
+    """
+    if not os.path.exists(benchmark_path):
+        os.makedirs(benchmark_path)
+
+    report = {
+        'timestamp': datetime.now().strftime('%d/%m/%Y-%H:%M:%S'),
+        'scenarios': scenarios
+    }
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2, default=float)
+    logging.info(f"STEP: benchmark, results dumped to {path}")
+
+
+def check_regression(scenarios: dict, baseline: dict, tolerance: float):
+    """
+    Compare benchmark results to baseline
+    a scenario regresses if its p95 latency grows or its QPS drops by more than tolerance,
+    scenarios run with different load parameters than the baseline are not comparable and fail the check
+    :param scenarios: dict of current scenario results
+    :param baseline: dict of baseline scenario results
+    :param tolerance: float allowed relative change, e.g. 0.25 for 25 %
+    :return: list of regression messages, empty if no regression occurs
+    """
+    regressions = list()
+    for name, result in scenarios.items():
+        if name not in baseline:
+            logging.info(f"STEP: benchmark, no baseline for {name}")
+            continue
+        reference = baseline[name]
+        load_mismatch = [key for key in ('requests', 'concurrency') if result[key] != reference[key]]
+        if load_mismatch:
+            regressions.append(f"{name}: {', '.join(f'{key} {result[key]}, baseline {reference[key]}' for key in load_mismatch)}"
+                               f" - not comparable, re-run with baseline load or save a new baseline")
+            continue
+        if result['p95_ms'] > reference['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.1f} ms, baseline {reference['p95_ms']:.1f} ms")
+        if result['qps'] < reference['qps'] * (1 - tolerance):
+            regressions.append(f"{name}: qps {result['qps']:.1f}, baseline {reference['qps']:.1f}")
+        if result['errors'] > reference['errors']:
+            regressions.append(f"{name}: {result['errors']} errors, baseline {reference['errors']}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark API endpoints')
+    parser.add_argument('--url', default=None,
+                        help='benchmark an already running API instead of starting one')
+    parser.add_argument('--endpoints', nargs='+', default=DEFAULT_ENDPOINTS, choices=ALL_ENDPOINTS)
+    parser.add_argument('--payload-rows', nargs='+', type=int, default=DEFAULT_PAYLOAD_ROWS)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--save-baseline', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--check', action='store_true', help='fail if results regress against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    logging.info("STEP: benchmark, begin")
+    args = parse_args()
+
+    if args.check and not os.path.exists(baseline_path):
+        logging.error(f"STEP: benchmark, no baseline at {baseline_path}, run with --save-baseline first")
+        sys.exit(1)
+
+    server = None if args.url else start_server()
+    try:
+        results = run_benchmark(base_url=args.url or f'http://{HOST}:{PORT}',
+                                endpoints=args.endpoints,
+                                payload_rows=args.payload_rows,
+                                concurrency=args.concurrency,
+                                n_requests=args.requests,
+                                server_pid=server.pid if server else None)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    save_results(results, latest_path)
+    if args.save_baseline:
+        save_results(results, baseline_path)
+
+    if args.check:
+        with open(baseline_path) as f:
+            baseline_results = json.load(f)['scenarios']
+        regression_list = check_regression(results, baseline_results, args.tolerance)
+        for regression in regression_list:
+            logging.error(f"STEP: benchmark, regression {regression}")
+        if regression_list:
+            sys.exit(1)
+        logging.info("STEP: benchmark, no regression occurred")
+
+    logging.info("STEP: benchmark, done")
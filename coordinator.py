@@ -0,0 +1,179 @@
+"""
+This script provides a coordination of pipeline runs and readers of its artifacts.
+Coordination consists of :
+    1. exclusive run lock, overlapping runs skip or wait for the running one
+    2. crash-consistent writes - temp file, fsync and atomic rename
+    3. consistent snapshot of the model and its version for readers
+
+author: Ondrej Ploteny <ondrej.ploteny@thermofisher.com>
+Nov 2023
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from contextlib import contextmanager
+
+import instrumentation
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+# Load config.json and get path variables
+with open('config.json', 'r') as f:
+    config = json.load(f)
+
+run_lock_path = os.path.join(config['run_lock_path'])
+run_lock_timeout = config['run_lock_timeout']
+
+LOCK_POLL_INTERVAL = 1.0
+
+model_load_time = instrumentation.histogram('model_load_seconds', 'Time spent reading and unpickling the model',
+                                            labelnames=('path',))
+
+_model_cache = dict()
+_model_cache_lock = threading.Lock()
+
+
+class PipelineLocked(RuntimeError):
+    """
+    Raised when another pipeline run holds the run lock
+    """
+
+
+def _try_lock(file):
+    file.seek(0)
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+
+
+@contextmanager
+def pipeline_lock(path: str = run_lock_path, timeout: float = run_lock_timeout):
+    """
+    Hold exclusive run lock, the lock is released by OS even if the process crashes
+    :param path: str path to lock file
+    :param timeout: float seconds to wait for running pipeline, 0 to skip immediately
+    :raises PipelineLocked: if lock is not acquired within timeout
+    """
+    lock_file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), 'r+')
+    try:
+        deadline = timeit.default_timer() + timeout
+        while True:
+            try:
+                _try_lock(lock_file)
+                break
+            except OSError:
+                if timeit.default_timer() >= deadline:
+                    raise PipelineLocked(f"pipeline lock {path} is held by another run")
+                time.sleep(LOCK_POLL_INTERVAL)
+
+        # pid of lock holder, for debugging only
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        logging.info(f"STEP: coordinator, pipeline lock {path} acquired")
+        yield
+    finally:
+        lock_file.close()
+
+
+def _fsync_directory(directory: str):
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'w'):
+    """
+    Open temp file next to path, on success fsync it and rename it over path
+    readers see either old or new complete file, never a partially written one
+    :param path: str destination path
+    :param mode: str 'w' or 'wb'
+    :return: context manager yielding file object
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        # mkstemp creates owner-only file, keep permissions of replaced file instead
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+        with os.fdopen(fd, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_directory(directory)
+
+
+def atomic_copy(src: str, dst: str):
+    """
+    Copy file, destination is replaced atomically
+    :param src: str source path
+    :param dst: str destination path
+    :return: None
+    """
+    with open(src, 'rb') as src_file, atomic_write(dst, 'wb') as dst_file:
+        shutil.copyfileobj(src_file, dst_file)
+
+
+def load_model(path: str):
+    """
+    Load pickled model together with its version
+    model is read once from a single open file, so model and version always match,
+    unchanged file is served from memory instead of unpickling it again
+    :param path: str path to pickled model
+    :return: tuple (model, str version - sha256 prefix of pickle content)
+    """
+    model, version, _ = load_model_snapshot(path)
+    return model, version
+
+
+def load_model_snapshot(path: str):
+    """
+    Load pickled model together with its version and deployment generation
+    every deployment replaces the file, so mtime of the file orders deployed versions
+    :param path: str path to pickled model
+    :return: tuple (model, str version, int generation - mtime of the model file in ns)
+    """
+    with open(path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+        with _model_cache_lock:
+            cached = _model_cache.get(path)
+        if cached is not None and cached[0] == identity:
+            return cached[1], cached[2], stat.st_mtime_ns
+
+        load_start = timeit.default_timer()
+        content = file.read()
+
+    model = pickle.loads(content)
+    version = hashlib.sha256(content).hexdigest()[:12]
+    model_load_time.observe(timeit.default_timer() - load_start, path=path)
+
+    with _model_cache_lock:
+        _model_cache[path] = (identity, model, version)
+    return model, version, stat.st_mtime_ns
@@ -8,6 +8,8 @@ Nov 2023
 import os
 import json
 import logging
+import instrumentation
+import coordinator
 import sys
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
@@ -22,34 +24,47 @@ prod_deployment_path = os.path.join(config['prod_deployment_path'])
 output_model_path = os.path.join(config['output_model_path'])
 
 
+@instrumentation.traced('deployment')
 def store_model_into_pickle():
     """
     function for deployment
     copy the latest pickle file, the latestscore.txt value, and the ingestfiles.txt file into the deployment directory
+    every file is replaced atomically, so API never reads a partially copied model
     """
-    command = 'cp'
-
     if not os.path.exists(prod_deployment_path):
         os.makedirs(prod_deployment_path)
 
-    model_filename = 'trainedmodel.pkl'
-    model_path_src = os.path.join(output_model_path, model_filename)
-    model_path_dst = os.path.join(prod_deployment_path, model_filename)
-    os.system(f'{command} {model_path_src} {model_path_dst}')
-    logging.info(f"STEP: deploying, {model_filename} deployed")
-
     score_filename = 'latestscore.txt'
     score_path_src = os.path.join(output_model_path, score_filename)
     score_path_dst = os.path.join(prod_deployment_path, score_filename)
-    os.system(f'{command} {score_path_src} {score_path_dst}')
+    coordinator.atomic_copy(score_path_src, score_path_dst)
     logging.info(f"STEP: deploying, {score_filename} deployed")
 
     ingested_filename = 'ingestedfiles.txt'
     ingested_path_src = os.path.join(dataset_csv_path, ingested_filename)
     ingested_path_dst = os.path.join(prod_deployment_path, ingested_filename)
-    os.system(f'{command} {ingested_path_src} {ingested_path_dst}')
+    coordinator.atomic_copy(ingested_path_src, ingested_path_dst)
     logging.info(f"STEP: deploying, {ingested_filename} deployed")
 
+    reference_filename = 'driftreference.json'
+    reference_path_src = os.path.join(output_model_path, reference_filename)
+    reference_path_dst = os.path.join(prod_deployment_path, reference_filename)
+    # models trained before drift detection have no reference, drift check then falls back to F1 score
+    if os.path.exists(reference_path_src):
+        coordinator.atomic_copy(reference_path_src, reference_path_dst)
+        logging.info(f"STEP: deploying, {reference_filename} deployed")
+    else:
+        if os.path.exists(reference_path_dst):
+            os.remove(reference_path_dst)
+        logging.info(f"STEP: deploying, {reference_filename} not found, deployed without drift reference")
+
+    # model goes last, API picks it up only when the files it belongs to are in place
+    model_filename = 'trainedmodel.pkl'
+    model_path_src = os.path.join(output_model_path, model_filename)
+    model_path_dst = os.path.join(prod_deployment_path, model_filename)
+    coordinator.atomic_copy(model_path_src, model_path_dst)
+    logging.info(f"STEP: deploying, {model_filename} deployed")
+
 
 if __name__ == '__main__':
     logging.info("STEP: deploying, begin")
@@ -10,7 +10,6 @@ author: Ondrej Ploteny <ondrej.ploteny@thermofisher.com>
 Nov 2023
 """
 
-import pickle
 import subprocess
 import sys
 
@@ -19,6 +18,9 @@ import timeit
 import os
 import json
 import logging
+import instrumentation
+import schema
+import coordinator
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
@@ -30,27 +32,41 @@ dataset_csv_path = os.path.join(config['output_folder_path'])
 test_data_path = os.path.join(config['test_data_path']) 
 prod_deployment_path = os.path.join(config['prod_deployment_path'])
 
+predicted_rows = instrumentation.counter('prediction_rows_total', 'Number of rows predicted by deployed model')
 
-def model_predictions(data_to_predict: pd.DataFrame):
+
+def deployed_model():
+    """
+    Load deployed model
+    :return: tuple (model, str model version, int deployment generation)
+    """
+    model_path = os.path.join(prod_deployment_path, 'trainedmodel.pkl')
+    return coordinator.load_model_snapshot(model_path)
+
+
+@instrumentation.traced('diagnostics.model_predictions')
+def model_predictions(data_to_predict: pd.DataFrame, model=None):
     """
     Function to get model predictions
     read the deployed model and a test dataset, calculate predictions
     return value should be a list containing all predictions
 
     :param data_to_predict: pd.DataFrame
+    :param model: model to use instead of the deployed one, e.g. from deployed_model()
     :return:
     """
+    if model is None:
+        model, _, _ = deployed_model()
 
-    model_path = os.path.join(prod_deployment_path, 'trainedmodel.pkl')
-
-    model = pickle.load(open(model_path, 'rb'))
     predictions = model.predict(data_to_predict)
+    predicted_rows.inc(len(predictions))
 
     assert len(data_to_predict) == len(predictions)
 
     return predictions.tolist()
 
 
+@instrumentation.traced('diagnostics.dataframe_summary')
 def dataframe_summary():
     """
     Function to get summary statistics
@@ -60,17 +76,17 @@ def dataframe_summary():
     """
     dataset_path = os.path.join(dataset_csv_path, 'finaldata.csv')
 
-    data_df = pd.read_csv(dataset_path)
-    data_df = data_df.drop(['exited'], axis=1)
+    data_df = schema.read_dataset(dataset_path)
+    data_df = data_df.drop([schema.TARGET_COLUMN], axis=1)
     data_df = data_df.select_dtypes(include='number')
 
     numeric_values = data_df.select_dtypes(include='number')
     result_dict = numeric_values.agg(['mean', 'median', 'std'])
     result_list = [
         {'column': col,
-         'mean': result_dict[col][0],
-         'median': result_dict[col][1],
-         'std_dev': result_dict[col][2]}
+         'mean': float(result_dict.loc['mean', col]),
+         'median': float(result_dict.loc['median', col]),
+         'std_dev': float(result_dict.loc['std', col])}
         for col in result_dict.columns
     ]
     return result_list
@@ -89,6 +105,7 @@ def _measure_subprocess_execution_time(command):
     return duration
 
 
+@instrumentation.traced('diagnostics.execution_time')
 def execution_time():
     """
     Function to get timings
@@ -103,17 +120,20 @@ def execution_time():
     return timing_list
 
 
+@instrumentation.traced('diagnostics.missing_data')
 def missing_data():
     """
     Calculate percentage of missing values per each column of dataset
     :return dictionary, keys are column names, values are percentages
     """
     dataset_path = os.path.join(dataset_csv_path, 'finaldata.csv')
+    # inferred dtypes, non-nullable schema dtypes would fail on the very values this reports
     data = pd.read_csv(dataset_path)
     missing_percentage = (data.isna().mean() * 100).round(2).to_dict()
     return missing_percentage
 
 
+@instrumentation.traced('diagnostics.outdated_packages_list')
 def outdated_packages_list():
     """
     Function to check dependencies
@@ -128,7 +148,7 @@ if __name__ == '__main__':
     logging.info("STEP: diagnostics, begin")
 
     test_dataset_path = os.path.join(test_data_path, 'testdata.csv')
-    test_df = pd.read_csv(test_dataset_path)
+    test_df = schema.read_dataset(test_dataset_path)
     X_df = test_df.drop(['corporation', 'exited'], axis=1)
     preds = model_predictions(data_to_predict=X_df)
     logging.info(f"STEP: diagnostics, predictions: {str(preds)}")
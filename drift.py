@@ -0,0 +1,220 @@
+"""
+This script provides a statistical data drift detection of predictor distributions.
+
+Training data is summarised into a compact reference sketch - per predictor histogram
+with quantile bin edges. Newly arrived datasets are streamed in chunks into the same bins
+and compared to the reference by Population Stability Index (PSI) and
+Kolmogorov-Smirnov (KS) statistic, so retraining can be decided without a full merge.
+PSI is noisy on small batches, below "drift_psi_min_rows" rows only KS decides.
+
+author: Ondrej Ploteny <ondrej.ploteny@thermofisher.com>
+Nov 2023
+"""
+
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import instrumentation
+import schema
+import coordinator
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+# Load config.json and get path variables
+with open('config.json', 'r') as f:
+    config = json.load(f)
+
+prod_deployment_path = os.path.join(config['prod_deployment_path'])
+psi_threshold = config['drift_psi_threshold']
+ks_alpha = config['drift_ks_alpha']
+psi_min_rows = config['drift_psi_min_rows']
+
+REFERENCE_FILENAME = 'driftreference.json'
+CHECKED_FILENAME = 'driftcheckedfiles.txt'
+checked_files_path = os.path.join(prod_deployment_path, CHECKED_FILENAME)
+PREDICTOR_COLUMNS = schema.PREDICTOR_COLUMNS
+N_BINS = 10
+CHUNK_SIZE = 100000
+EPSILON = 1e-4
+
+# c(alpha) of the two-sample KS test critical value
+_KS_COEFFICIENTS = {0.1: 1.224, 0.05: 1.358, 0.025: 1.48, 0.01: 1.628, 0.005: 1.731, 0.001: 1.949}
+
+
+def build_reference(df: pd.DataFrame, n_bins: int = N_BINS):
+    """
+    Build reference sketch of predictor distributions from training data
+    :param df: pd.DataFrame training data containing predictor columns
+    :param n_bins: int maximal number of quantile bins per predictor
+    :return: dict, keys are column names, values contain bin edges, counts and row count
+    """
+    reference = dict()
+    for column in PREDICTOR_COLUMNS:
+        values = df[column].dropna().to_numpy(dtype=float)
+        # interior edges only, outer bins are open so unseen extremes still fall into a bin
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+        reference[column] = {
+            'edges': edges.tolist(),
+            'counts': counts.tolist(),
+            'n': int(counts.sum())
+        }
+    return reference
+
+
+def save_reference(reference: dict, path: str):
+    """
+    Write reference sketch to json file
+    :param reference: dict reference sketch
+    :param path: str output path
+    :return: None
+    """
+    with coordinator.atomic_write(path) as file:
+        json.dump(reference, file)
+    logging.info(f"STEP: drift, reference sketch dumped to {path}")
+
+
+def load_reference(path: str = os.path.join(prod_deployment_path, REFERENCE_FILENAME)):
+    """
+    Load reference sketch, by default the one of deployed model
+    :param path: str path to reference sketch
+    :return: dict reference sketch or None if it does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def load_checked_files(path: str = checked_files_path):
+    """
+    Load datasets already included in a drift check without drift
+    :param path: str path to the list, same format as ingestedfiles.txt
+    :return: set of dataset paths
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path) as file:
+        return {line.strip().split(' ', 1)[1] for line in file if line.strip()}
+
+
+def record_checked_files(dataset_paths, path: str = checked_files_path):
+    """
+    Append datasets to the list of drift-checked datasets, next run is skipped unless another dataset arrives
+    :param dataset_paths: iterable of dataset paths
+    :param path: str path to the list
+    :return: None
+    """
+    lines = list()
+    if os.path.exists(path):
+        with open(path) as file:
+            lines = [line.rstrip('\n') for line in file if line.strip()]
+    curr_timestamp = datetime.now().strftime('%d/%m/%Y-%H:%M:%S')
+    lines.extend(f"{curr_timestamp} {dataset_path}" for dataset_path in sorted(dataset_paths))
+
+    with coordinator.atomic_write(path) as file:
+        file.write("\n".join(lines))
+    logging.info(f"STEP: drift, checked datasets recorded to {path}")
+
+
+def sketch_files(dataset_paths, reference: dict, chunk_size: int = CHUNK_SIZE):
+    """
+    Stream datasets in chunks and count predictor values into reference bins
+    :param dataset_paths: iterable of csv paths
+    :param reference: dict reference sketch providing bin edges
+    :param chunk_size: int number of rows read at once
+    :return: dict, keys are column names, values are np.array bin counts
+    """
+    edges = {column: np.asarray(reference[column]['edges']) for column in PREDICTOR_COLUMNS}
+    counts = {column: np.zeros(len(edges[column]) + 1, dtype=np.int64) for column in PREDICTOR_COLUMNS}
+
+    for dataset_path in dataset_paths:
+        # new datasets are not validated yet, malformed values are skipped instead of failing
+        for chunk in pd.read_csv(dataset_path, usecols=PREDICTOR_COLUMNS, chunksize=chunk_size):
+            for column in PREDICTOR_COLUMNS:
+                values = pd.to_numeric(chunk[column], errors='coerce').dropna().to_numpy(dtype=float)
+                bins = np.searchsorted(edges[column], values, side='right')
+                counts[column] += np.bincount(bins, minlength=len(counts[column]))
+    return counts
+
+
+def population_stability_index(expected_counts, actual_counts):
+    """
+    PSI between two binned distributions, empty bins are smoothed by EPSILON
+    :return: float, < 0.1 stable, 0.1 - 0.2 moderate shift, > 0.2 significant shift
+    """
+    expected = np.clip(np.asarray(expected_counts, dtype=float) / max(np.sum(expected_counts), 1), EPSILON, None)
+    actual = np.clip(np.asarray(actual_counts, dtype=float) / max(np.sum(actual_counts), 1), EPSILON, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks_statistic(expected_counts, actual_counts):
+    """
+    Two-sample KS statistic evaluated on bin edges, a lower bound of the exact statistic
+    :return: float maximal distance of empirical CDFs
+    """
+    expected_cdf = np.cumsum(expected_counts) / max(np.sum(expected_counts), 1)
+    actual_cdf = np.cumsum(actual_counts) / max(np.sum(actual_counts), 1)
+    return float(np.max(np.abs(expected_cdf - actual_cdf)))
+
+
+def ks_critical_value(n_expected: int, n_actual: int, alpha: float = ks_alpha):
+    """
+    Critical value of two-sample KS test for given sample sizes
+    :return: float
+    """
+    coefficient = _KS_COEFFICIENTS.get(alpha, np.sqrt(-np.log(alpha / 2) / 2))
+    return float(coefficient * np.sqrt((n_expected + n_actual) / (n_expected * n_actual)))
+
+
+@instrumentation.traced('drift')
+def detect_drift(dataset_paths, reference: dict = None):
+    """
+    Compare newly arrived datasets to reference sketch of deployed model
+    :param dataset_paths: iterable of csv paths
+    :param reference: dict reference sketch, deployed one is loaded if not given
+    :return: dict with per column statistics and overall 'drift' flag, None if no reference exists
+    """
+    if reference is None:
+        reference = load_reference()
+    if reference is None:
+        logging.info("STEP: drift, no reference sketch available")
+        return None
+
+    dataset_paths = [path for path in dataset_paths if path.endswith('.csv')]
+    actual_counts = sketch_files(dataset_paths, reference)
+
+    report = {'drift': False, 'columns': dict()}
+    for column in PREDICTOR_COLUMNS:
+        expected_counts = reference[column]['counts']
+        n_actual = int(actual_counts[column].sum())
+        if n_actual == 0:
+            continue
+
+        psi = population_stability_index(expected_counts, actual_counts[column])
+        ks = ks_statistic(expected_counts, actual_counts[column])
+        ks_critical = ks_critical_value(reference[column]['n'], n_actual)
+        # KS critical value grows for small samples, fixed PSI threshold does not
+        psi_drift = n_actual >= psi_min_rows and psi > psi_threshold
+        column_drift = psi_drift or ks > ks_critical
+
+        report['columns'][column] = {'psi': psi, 'psi_used': n_actual >= psi_min_rows, 'ks': ks,
+                                     'ks_critical': ks_critical, 'rows': n_actual, 'drift': column_drift}
+        report['drift'] = report['drift'] or column_drift
+        logging.info(f"STEP: drift, {column}: psi {psi:.4f}, ks {ks:.4f} (critical {ks_critical:.4f})")
+
+    return report
+
+
+if __name__ == '__main__':
+    logging.info("STEP: drift, begin")
+    source_paths = [os.path.join(config['input_folder_path'], filename)
+                    for filename in os.listdir(config['input_folder_path'])]
+    drift_report = detect_drift(source_paths)
+    logging.info(f"STEP: drift, report: {drift_report}")
+    logging.info("STEP: drift, done")
@@ -9,7 +9,6 @@ import os
 import json
 import sys
 
-import pandas as pd
 import subprocess
 import ingestion
 import training
@@ -17,7 +16,12 @@ import scoring
 import deployment
 import diagnostics
 import reporting
+import drift
+import schema
+import coordinator
 import logging
+import instrumentation
+from datetime import datetime
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
@@ -81,26 +85,44 @@ def full_process():
         check if data drift occurs and re-train new model if it is needed
         deploy new model if score is sufficient
         log all metrics
-    :return:
+    :return: True if a new model was deployed, API endpoints should be tested then
     """
 
     try:
         # if you found new data, you should proceed. otherwise, do end the process here
-        if not check_for_new_dataset():
+        new_datasets = check_for_new_dataset()
+        if not new_datasets:
             logging.info("STEP: ingestion, no new dataset occurs")
             return
 
-        # process new ingested data
+        # nothing arrived since the last drift check, statistics would not change
+        unchecked_datasets = new_datasets - drift.load_checked_files()
+        if not unchecked_datasets:
+            logging.info("STEP: drift, no new dataset since last drift check")
+            return
+
+        # compare distributions of all not yet ingested data to training data of deployed model, no merge needed
+        # small batches are pooled, so gradual drift accumulates evidence across runs
         logging.info("STEP: ingestion, new dataset occurs - check drift")
+        drift_report = drift.detect_drift(new_datasets)
+        if drift_report is not None and not drift_report['drift']:
+            logging.info("STEP: drift, No data drift occurred")
+            drift.record_checked_files(unchecked_datasets)
+            return None
+
+        # process new ingested data
         ingestion.merge_multiple_dataframe()
 
-        # check for data drift
-        deployed_score = load_previous_score(score_file_path)
-        actual_f1_score = scoring.score_model(is_dump=False)
+        if drift_report is not None:
+            logging.info(f"STEP: drift, data drift occurred: {drift_report['columns']}")
+        else:
+            # without reference sketch fall back to check for model drift
+            deployed_score = load_previous_score(score_file_path)
+            actual_f1_score = scoring.score_model(is_dump=False)
 
-        if actual_f1_score >= deployed_score:
-            logging.info("STEP: ingestion, No model drift occurred")
-            return None
+            if actual_f1_score >= deployed_score:
+                logging.info("STEP: ingestion, No model drift occurred")
+                return None
     except FileNotFoundError:
         logging.info("STEP: ingestion, No data exists, run first training")
         ingestion.merge_multiple_dataframe()
@@ -118,7 +140,7 @@ def full_process():
 
     logging.info("STEP: diagnostics, begin")
     test_dataset_path = os.path.join(config['test_data_path'], 'testdata.csv')
-    test_df = pd.read_csv(test_dataset_path)
+    test_df = schema.read_dataset(test_dataset_path)
     X_df = test_df.drop(['corporation', 'exited'], axis=1)
     preds = diagnostics.model_predictions(data_to_predict=X_df)
     logging.info(f"STEP: diagnostics, predictions: {str(preds)}")
@@ -138,12 +160,26 @@ def full_process():
 
     logging.info("STEP: reporting")
     reporting.score_model()
-
-    logging.info(f"STEP: diagnostics, call apicalls.py to test API endpoints")
-    subprocess.run(['sudo', 'python', 'apicalls.py'])
+    return True
 
 
 if __name__ == "__main__":
     logging.info("STEP: Full MLops process, begin")
-    full_process()
+    is_deployed = False
+    try:
+        # overlapping cron runs skip (or wait up to run_lock_timeout) instead of writing the same artifacts
+        with coordinator.pipeline_lock():
+            instrumentation.start_trace()
+            try:
+                with instrumentation.span('fullprocess'):
+                    is_deployed = full_process()
+            finally:
+                instrumentation.dump_trace(f"fullprocess_{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    except coordinator.PipelineLocked:
+        logging.info("STEP: Full MLops process, another run in progress - skipped")
+
+    # after the lock is released, /diagnostics would answer 503 while this run holds it
+    if is_deployed:
+        logging.info(f"STEP: diagnostics, call apicalls.py to test API endpoints")
+        subprocess.run(['sudo', 'python', 'apicalls.py'])
     logging.info("STEP: Full MLops process, done")
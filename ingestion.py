@@ -12,6 +12,9 @@ import sys
 import json
 from datetime import datetime
 import logging
+import instrumentation
+import schema
+import coordinator
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
@@ -22,6 +25,12 @@ with open('config.json', 'r') as f:
 input_folder_path = config['input_folder_path']
 output_folder_path = config['output_folder_path']
 
+ingested_rows = instrumentation.counter('ingestion_rows_total', 'Number of rows read from source datasets',
+                                        labelnames=('source',))
+ingested_files = instrumentation.counter('ingestion_files_total', 'Number of source datasets ingested')
+rejected_rows = instrumentation.counter('ingestion_rejected_rows_total', 'Number of rows rejected by schema',
+                                        labelnames=('source',))
+
 
 def locate_datasets(directory_path: str, extension: str = '.csv'):
     """
@@ -37,33 +46,54 @@ def locate_datasets(directory_path: str, extension: str = '.csv'):
             yield os.path.join(directory_path, file)
 
 
+@instrumentation.traced('ingestion')
 def merge_multiple_dataframe():
     """
     Function for data ingestion, check for datasets, compile them together, and write to an output file
+    rows not matching the schema are written to rejectedrows.csv,
+    schema.SchemaError is raised for datasets which do not match the schema as a whole
 
     :return:
     """
     final_dataset_log = list()
-    final_dataset = pd.DataFrame()
+    # empty frames keep columns and dtypes when the input folder contains no dataset
+    dataset_list = [schema.empty_dataset()]
+    rejected_list = [pd.DataFrame(columns=list(schema.SCHEMA) + ['source', 'reason'])]
     final_dataset_path = os.path.join(output_folder_path, 'finaldata.csv')
     final_log_path = os.path.join(output_folder_path, 'ingestedfiles.txt')
+    rejected_path = os.path.join(output_folder_path, 'rejectedrows.csv')
 
     for dataset_path in locate_datasets(input_folder_path):
-        curr_dataset = pd.read_csv(dataset_path)
-        final_dataset = pd.concat([final_dataset, curr_dataset], ignore_index=True)
+        with instrumentation.span('ingestion.read', source=dataset_path):
+            raw_dataset = pd.read_csv(dataset_path, dtype=str)
+            curr_dataset, curr_rejected = schema.validate(raw_dataset, source=dataset_path)
+        ingested_rows.inc(len(curr_dataset), source=dataset_path)
+        rejected_rows.inc(len(curr_rejected), source=dataset_path)
+        ingested_files.inc()
+        dataset_list.append(curr_dataset)
+        rejected_list.append(curr_rejected)
         curr_timestamp = datetime.now().strftime('%d/%m/%Y-%H:%M:%S')
         final_dataset_log.append(f"{curr_timestamp} {dataset_path}")
         logging.info(f"STEP: ingestion, partial dataset loaded {dataset_path}")
 
+    # categories differ per dataset, concat falls back to object so dtypes are applied again
+    final_dataset = pd.concat(dataset_list, ignore_index=True).astype(schema.dtypes())
     final_dataset.drop_duplicates(inplace=True)
 
     if not os.path.exists(output_folder_path):
         os.makedirs(output_folder_path)
 
-    final_dataset.to_csv(final_dataset_path, index=False)
+    with instrumentation.span('ingestion.write', rows=len(final_dataset)):
+        with coordinator.atomic_write(final_dataset_path) as file:
+            final_dataset.to_csv(file, index=False)
     logging.info(f"STEP: ingestion, dataset dumped to {final_dataset_path}")
 
-    with open(final_log_path, "w") as file:
+    rejected_dataset = pd.concat(rejected_list, ignore_index=True)
+    with coordinator.atomic_write(rejected_path) as file:
+        rejected_dataset.to_csv(file, index=False)
+    logging.info(f"STEP: ingestion, {len(rejected_dataset)} rejected rows dumped to {rejected_path}")
+
+    with coordinator.atomic_write(final_log_path) as file:
         file.write("\n".join(final_dataset_log))
         logging.info(f"STEP: ingestion, log dumped to {final_log_path}")
 
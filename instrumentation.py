@@ -0,0 +1,296 @@
+"""
+This script provides a lightweight instrumentation layer shared by the pipeline and the API.
+Instrumentation consists of :
+    1. counters and histograms rendered in Prometheus text format
+    2. timing spans, recorded as stage duration histograms
+    3. per-run trace file in Chrome trace event format (chrome://tracing, Perfetto)
+
+Metrics are kept per process, when disabled by "metrics_enabled" in config.json
+every call returns immediately.
+
+author: Ondrej Ploteny <ondrej.ploteny@thermofisher.com>
+Nov 2023
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import timeit
+from contextlib import contextmanager
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+# Load config.json and get instrumentation settings
+with open('config.json', 'r') as f:
+    config = json.load(f)
+
+enabled = config.get('metrics_enabled', True)
+trace_path = os.path.join(config['trace_path'])
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = dict()
+_registry_lock = threading.Lock()
+
+_trace_events = None
+_trace_lock = threading.Lock()
+_trace_origin = 0.0
+
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: str = ''):
+    """
+    Render label set in Prometheus text format
+    :return: str e.g. {stage="training"}
+    """
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in zip(labelnames, labelvalues)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """
+    Monotonically increasing counter with optional labels
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Increase counter by amount
+        :param amount: float non-negative increment
+        :param labels: label values, keys have to match labelnames
+        :return: None
+        """
+        if not enabled:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        """
+        Current counter value for given labels
+        :return: float
+        """
+        key = tuple(labels[name] for name in self.labelnames)
+        return self._values.get(key, 0.0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram:
+    """
+    Histogram with fixed cumulative buckets and optional labels
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """
+        Record single observation
+        :param value: float observed value, e.g. duration in seconds
+        :param labels: label values, keys have to match labelnames
+        :return: None
+        """
+        if not enabled:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state['counts']))) for key, state in self._values.items())
+        lines = list()
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, key, 'le="{}"'.format(bound))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {state['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {state['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state['count']}")
+        return lines
+
+
+def _get_or_create(metric_class, name: str, documentation: str, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = metric_class(name, documentation, **kwargs)
+        elif not isinstance(metric, metric_class):
+            raise ValueError(f"metric {name} is already registered as {metric.kind}")
+    return metric
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()):
+    """
+    Get registered counter, create it if it does not exist
+    :return: Counter
+    """
+    return _get_or_create(Counter, name, documentation, labelnames=labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+    """
+    Get registered histogram, create it if it does not exist
+    :return: Histogram
+    """
+    return _get_or_create(Histogram, name, documentation, labelnames=labelnames, buckets=buckets)
+
+
+def render_prometheus():
+    """
+    Render all registered metrics in Prometheus text exposition format
+    :return: str
+    """
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = list()
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+stage_duration = histogram('pipeline_stage_duration_seconds', 'Duration of pipeline stages and spans',
+                           labelnames=('stage',))
+stage_errors = counter('pipeline_stage_errors_total', 'Number of pipeline stages and spans that raised',
+                       labelnames=('stage',))
+
+
+class _NoopSpan:
+    """
+    Span returned while instrumentation is disabled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+@contextmanager
+def _span(name: str, attributes: dict):
+    start_time = timeit.default_timer()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage=name)
+        raise
+    finally:
+        duration = timeit.default_timer() - start_time
+        stage_duration.observe(duration, stage=name)
+        if _trace_events is not None:
+            event = {
+                'name': name,
+                'ph': 'X',
+                'ts': (start_time - _trace_origin) * 1e6,
+                'dur': duration * 1e6,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': attributes
+            }
+            with _trace_lock:
+                _trace_events.append(event)
+
+
+def span(name: str, **attributes):
+    """
+    Time a block of code, duration is recorded to pipeline_stage_duration_seconds
+    and to the trace file if tracing is active
+    :param name: str stage name
+    :param attributes: additional values stored in the trace event
+    :return: context manager
+    """
+    if not enabled:
+        return _NOOP_SPAN
+    return _span(name, attributes)
+
+
+def traced(name: str):
+    """
+    Decorator running whole function inside a span
+    :param name: str stage name
+    :return: decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace():
+    """
+    Start collecting span events for a per-run trace file
+    :return: None
+    """
+    global _trace_events, _trace_origin
+    if not enabled:
+        return
+    with _trace_lock:
+        _trace_events = list()
+        _trace_origin = timeit.default_timer()
+
+
+def dump_trace(run_name: str):
+    """
+    Stop collecting span events and write them to the trace directory
+    :param run_name: str name of the trace file without extension
+    :return: str path to the trace file or None if tracing is not active
+    """
+    global _trace_events
+    with _trace_lock:
+        events, _trace_events = _trace_events, None
+    if events is None:
+        return None
+
+    if not os.path.exists(trace_path):
+        os.makedirs(trace_path)
+
+    run_trace_path = os.path.join(trace_path, f'{run_name}.json')
+    with open(run_trace_path, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+    logging.info(f"STEP: instrumentation, trace dumped to {run_trace_path}")
+    return run_trace_path
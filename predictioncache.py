@@ -0,0 +1,140 @@
+"""
+This script provides a bounded server-side cache of batch predictions.
+
+Entries are keyed on input file (path, size, mtime or content hash) and deployed model version,
+evicted in LRU order once their size exceeds the memory budget and dropped as soon as
+a new model version is deployed.
+
+author: Ondrej Ploteny <ondrej.ploteny@thermofisher.com>
+Nov 2023
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import instrumentation
+
+# Load config.json and get cache settings
+with open('config.json', 'r') as f:
+    config = json.load(f)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+cache_hits = instrumentation.counter('prediction_cache_hits_total', 'Number of predictions served from cache')
+cache_misses = instrumentation.counter('prediction_cache_misses_total', 'Number of predictions computed')
+cache_evictions = instrumentation.counter('prediction_cache_evictions_total',
+                                          'Number of cache entries evicted by memory budget')
+cache_invalidations = instrumentation.counter('prediction_cache_invalidations_total',
+                                              'Number of cache entries dropped after new model deployment')
+
+
+def _file_digest(path: str):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache of predictions bounded by memory budget
+    """
+
+    def __init__(self, max_bytes: int, hash_content: bool = False):
+        """
+        :param max_bytes: int memory budget of cached predictions
+        :param hash_content: bool identify files by sha256 of content instead of mtime
+        """
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._model_version = None
+        self._model_generation = -1
+        self._lock = threading.Lock()
+
+    def key(self, path: str, model_version: str):
+        """
+        Build cache key of input file scored by given model
+        :param path: str path to input csv
+        :param model_version: str version of deployed model
+        :return: tuple cache key
+        """
+        real_path = os.path.realpath(path)
+        stat = os.stat(real_path)
+        file_identity = _file_digest(real_path) if self.hash_content else stat.st_mtime_ns
+        return real_path, stat.st_size, file_identity, model_version
+
+    def _advance_version(self, model_version: str, model_generation: int):
+        # caller holds the lock, cache only moves forward to a newer deployment,
+        # a late request of an older model must not drop entries of the current one
+        if model_generation <= self._model_generation:
+            return
+        if self._entries:
+            cache_invalidations.inc(len(self._entries))
+        self._entries.clear()
+        self.current_bytes = 0
+        self._model_version = model_version
+        self._model_generation = model_generation
+
+    def get(self, key: tuple, model_generation: int):
+        """
+        Get cached predictions, entries of older deployments are dropped once a newer one is seen
+        :param key: tuple built by key()
+        :param model_generation: int deployment generation of the model, see coordinator.load_model_snapshot
+        :return: list of predictions or None if not cached
+        """
+        with self._lock:
+            self._advance_version(key[-1], model_generation)
+            entry = self._entries.get(key) if key[-1] == self._model_version else None
+            if entry is None:
+                cache_misses.inc()
+                return None
+            self._entries.move_to_end(key)
+        cache_hits.inc()
+        return entry.tolist()
+
+    def put(self, key: tuple, predictions: list):
+        """
+        Store predictions, least recently used entries are evicted to fit the memory budget
+        predictions of a model other than the current one (request finished after deployment) are not stored
+        :param key: tuple built by key()
+        :param predictions: list of predictions
+        :return: None
+        """
+        entry = np.asarray(predictions)
+        entry_bytes = entry.nbytes + sys.getsizeof(key)
+        if entry_bytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key[-1] != self._model_version:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.nbytes + sys.getsizeof(key)
+            while self._entries and self.current_bytes + entry_bytes > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes + sys.getsizeof(evicted_key)
+                cache_evictions.inc()
+            self._entries[key] = entry
+            self.current_bytes += entry_bytes
+
+    def stats(self):
+        """
+        Cache usage
+        :return: dict with number of entries, used bytes and memory budget
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.current_bytes, 'max_bytes': self.max_bytes,
+                    'model_version': self._model_version}
+
+
+prediction_cache = PredictionCache(max_bytes=config['prediction_cache_max_bytes'],
+                                   hash_content=config['prediction_cache_hash_content'])
@@ -8,11 +8,13 @@ Nov 2023
 import os
 import sys
 import json
-import pandas as pd
 from sklearn import metrics
 import matplotlib.pyplot as plt
 import seaborn as sns
 from diagnostics import model_predictions
+import instrumentation
+import schema
+import coordinator
 
 import logging
 
@@ -28,6 +30,7 @@ test_data_path = os.path.join(config['test_data_path'], 'testdata.csv')
 confusion_matrix_path = os.path.join(config['output_model_path'], 'confusionmatrix.png')
 
 
+@instrumentation.traced('reporting')
 def score_model():
     """
     Function for reporting
@@ -35,13 +38,9 @@ def score_model():
     write the confusion matrix to the workspace
     """
 
-    target_column_name = 'exited'
-    predictor_column_name = ['lastmonth_activity',
-                             'lastyear_activity',
-                             'number_of_employees']
-
-    x_test = pd.read_csv(test_data_path, usecols=predictor_column_name)
-    y_true = pd.read_csv(test_data_path, usecols=[target_column_name]).values
+    test_df = schema.read_dataset(test_data_path)
+    x_test = test_df[schema.PREDICTOR_COLUMNS]
+    y_true = test_df[schema.TARGET_COLUMN].values
     y_pred = model_predictions(x_test)
 
     matrix = metrics.confusion_matrix(y_true, y_pred)
@@ -54,7 +53,8 @@ def score_model():
     ax.set_title('Confusion matrix')
     ax.set_xlabel('Predicted')
     ax.set_ylabel('Actual')
-    plt.savefig(confusion_matrix_path)
+    with coordinator.atomic_write(confusion_matrix_path, 'wb') as file:
+        plt.savefig(file, format='png')
     logging.info(f"STEP: training, report saved as {confusion_matrix_path}")
 
 
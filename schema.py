@@ -0,0 +1,119 @@
+"""
+This script provides a declarative schema of the risk dataset.
+Schema is used to:
+    1. validate raw datasets at ingestion time and quarantine malformed rows
+    2. load datasets with compact dtypes instead of inferred int64/object columns
+
+author: Ondrej Ploteny <ondrej.ploteny@thermofisher.com>
+Nov 2023
+"""
+
+import json
+import logging
+import sys
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+
+# Load config.json and get validation settings
+with open('config.json', 'r') as f:
+    config = json.load(f)
+
+max_reject_ratio = config['schema_max_reject_ratio']
+
+INT32_MAX = int(np.iinfo(np.int32).max)
+
+SCHEMA = {
+    'corporation': {'dtype': 'category', 'nullable': False},
+    'lastmonth_activity': {'dtype': 'int32', 'min': 0, 'max': INT32_MAX, 'nullable': False},
+    'lastyear_activity': {'dtype': 'int32', 'min': 0, 'max': INT32_MAX, 'nullable': False},
+    'number_of_employees': {'dtype': 'int32', 'min': 0, 'max': INT32_MAX, 'nullable': False},
+    'exited': {'dtype': 'uint8', 'min': 0, 'max': 1, 'nullable': False},
+}
+
+PREDICTOR_COLUMNS = ['lastmonth_activity', 'lastyear_activity', 'number_of_employees']
+TARGET_COLUMN = 'exited'
+
+
+class SchemaError(ValueError):
+    """
+    Raised when dataset does not match the schema as a whole
+    """
+
+
+def dtypes(columns: list = None):
+    """
+    Compact dtypes of schema columns
+    :param columns: list of column names, all schema columns if not given
+    :return: dict, keys are column names, values are dtypes
+    """
+    columns = list(SCHEMA) if columns is None else columns
+    return {column: SCHEMA[column]['dtype'] for column in columns}
+
+
+def empty_dataset():
+    """
+    Dataset without rows, with schema columns and compact dtypes
+    :return: pd.DataFrame
+    """
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes().items()})
+
+
+def read_dataset(path: str, usecols: list = None, **kwargs):
+    """
+    Load validated dataset with compact dtypes
+    :param path: str path to csv file
+    :param usecols: list of columns to load, all columns if not given
+    :param kwargs: other pd.read_csv arguments, e.g. chunksize
+    :return: pd.DataFrame (or chunk iterator if chunksize is given)
+    """
+    return pd.read_csv(path, usecols=usecols, dtype=dtypes(usecols), **kwargs)
+
+
+def validate(raw_df: pd.DataFrame, source: str = ''):
+    """
+    Validate raw dataset against the schema in a single vectorized pass
+    :param raw_df: pd.DataFrame loaded as strings (dtype=str)
+    :param source: str dataset name used in error messages and rejected rows
+    :return: tuple (valid pd.DataFrame with compact dtypes, rejected pd.DataFrame with reason column)
+    """
+    missing_columns = [column for column in SCHEMA if column not in raw_df.columns]
+    unexpected_columns = [column for column in raw_df.columns if column not in SCHEMA]
+    if missing_columns or unexpected_columns:
+        raise SchemaError(f"{source}: missing columns {missing_columns}, unexpected columns {unexpected_columns}")
+
+    values = dict()
+    invalid = pd.DataFrame(False, index=raw_df.index, columns=list(SCHEMA))
+    for column, spec in SCHEMA.items():
+        raw_values = raw_df[column]
+        if spec['dtype'] == 'category':
+            parsed = raw_values.str.strip().replace('', np.nan)
+            invalid[column] = parsed.isna() & (not spec['nullable'])
+        else:
+            parsed = pd.to_numeric(raw_values, errors='coerce')
+            invalid[column] = (
+                (parsed.isna() & (raw_values.notna() | (not spec['nullable'])))
+                | (parsed.notna() & (parsed % 1 != 0))
+                | (parsed < spec['min'])
+                | (parsed > spec['max'])
+            )
+        values[column] = parsed
+
+    row_invalid = invalid.any(axis=1)
+    valid_df = pd.DataFrame(values)[~row_invalid].astype(dtypes())
+
+    rejected_df = raw_df[row_invalid].copy()
+    rejected_df['source'] = source
+    reason = pd.Series('', index=rejected_df.index, dtype=object)
+    for column in SCHEMA:
+        reason += np.where(invalid.loc[row_invalid, column], f'{column} ', '')
+    rejected_df['reason'] = reason.str.strip()
+
+    if len(raw_df) and len(rejected_df) / len(raw_df) > max_reject_ratio:
+        raise SchemaError(f"{source}: {len(rejected_df)} of {len(raw_df)} rows rejected")
+    if len(rejected_df):
+        logging.info(f"STEP: schema, {source}: {len(rejected_df)} of {len(raw_df)} rows rejected")
+
+    return valid_df, rejected_df
@@ -6,13 +6,14 @@ Nov 2023
 """
 
 
-import pandas as pd
-import pickle
 import os
 import sys
 from sklearn import metrics
 import json
 import logging
+import instrumentation
+import schema
+import coordinator
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
@@ -25,6 +26,7 @@ output_model_path = os.path.join(config['output_model_path'])
 test_data_path = os.path.join(config['test_data_path'], 'testdata.csv')
 
 
+@instrumentation.traced('scoring')
 def score_model(is_dump: bool = True):
     """
     Function for model scoring,
@@ -37,24 +39,23 @@ def score_model(is_dump: bool = True):
     score_path = os.path.join(output_model_path, 'latestscore.txt')
 
     logging.info(f"STEP: scoring, loading model from {model_path}")
-    with open(model_path, 'rb') as m:
-        model = pickle.load(m)
+    model, model_version = coordinator.load_model(model_path)
+    logging.info(f"STEP: scoring, model version {model_version}")
 
-    test_df = pd.read_csv(test_data_path)
+    test_df = schema.read_dataset(test_data_path)
     logging.info(f"STEP: scoring, loading testdata from {test_data_path}, size: {len(test_df)}")
 
-    X = test_df[['lastmonth_activity',
-                 'lastyear_activity',
-                 'number_of_employees']]
-    y_test = test_df['exited']
+    X = test_df[schema.PREDICTOR_COLUMNS]
+    y_test = test_df[schema.TARGET_COLUMN]
 
     logging.info("STEP: scoring, making prediction")
-    y_pred = model.predict(X)
+    with instrumentation.span('scoring.predict', rows=len(X)):
+        y_pred = model.predict(X)
     f1_score = metrics.f1_score(y_test, y_pred)
     logging.info(f"STEP: scoring, f1 score: {f1_score}")
 
     if is_dump:
-        with open(score_path, "w") as file:
+        with coordinator.atomic_write(score_path) as file:
             file.write(str(f1_score))
             logging.info(f"STEP: scoring, score dumped to {score_path}")
 
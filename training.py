@@ -5,13 +5,16 @@ author: Ondrej Ploteny <ondrej.ploteny@thermofisher.com>
 Nov 2023
 """
 
-import pandas as pd
 import pickle
 import os
 import sys
 from sklearn.linear_model import LogisticRegression
 import json
 import logging
+import instrumentation
+import drift
+import schema
+import coordinator
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
@@ -23,11 +26,15 @@ with open('config.json', 'r') as f:
 dataset_csv_path = os.path.join(config['output_folder_path']) 
 model_path = os.path.join(config['output_model_path']) 
 
+training_rows = instrumentation.counter('training_rows_total', 'Number of rows used for model training')
+
 
 # Function for training the model
+@instrumentation.traced('training')
 def train_model():
     training_dataset_path = os.path.join(dataset_csv_path, 'finaldata.csv')
     final_model_path = os.path.join(model_path, 'trainedmodel.pkl')
+    reference_path = os.path.join(model_path, drift.REFERENCE_FILENAME)
     
     # use this logistic regression for training
     lr = LogisticRegression(C=1.0, class_weight=None, dual=False, fit_intercept=True,
@@ -37,22 +44,28 @@ def train_model():
                             warm_start=False)
     
     # fit the logistic regression to your data
-    df = pd.read_csv(training_dataset_path)
+    with instrumentation.span('training.read'):
+        df = schema.read_dataset(training_dataset_path)
+    training_rows.inc(len(df))
     logging.info(f"STEP: training, dataset path {training_dataset_path}, size: {len(df)}")
 
-    X = df[['lastmonth_activity', 'lastyear_activity', 'number_of_employees']]
-    y = df['exited']
+    X = df[schema.PREDICTOR_COLUMNS]
+    y = df[schema.TARGET_COLUMN]
 
-    lr.fit(X, y)
+    with instrumentation.span('training.fit', rows=len(df)):
+        lr.fit(X, y)
     
     # write the trained model to your workspace in a file called trainedmodel.pkl
     if not os.path.exists(model_path):
         os.makedirs(model_path)
 
-    with open(final_model_path, 'wb') as file:
+    with coordinator.atomic_write(final_model_path, 'wb') as file:
         pickle.dump(lr, file)
         logging.info(f"STEP: training, model dumped to {final_model_path}")
 
+    # reference distributions of training data, used to detect drift of incoming data
+    drift.save_reference(drift.build_reference(X), reference_path)
+
 
 if __name__ == '__main__':
     logging.info("STEP: training, begin")